@@ -1,149 +1,377 @@
 import os
-import io
+import asyncio
+import hashlib
 import json
-import fitz
-import docx
+import multiprocessing
+import operator
+import random
+import threading
+import unicodedata
+from string import Template
 import streamlit as st
 import google.generativeai as genai
-from models import CandidateAnalysis
+from google.generativeai import client as genai_client
+from google.api_core import exceptions as google_exceptions
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pydantic import ValidationError
+from models import CandidateAnalysis, gemini_batch_schema
+from parsers import parse_docx, parse_pdf_pages
 from dotenv import load_dotenv
 
 load_dotenv()
 
 try:
-    genai.configure(api_key=st.secrets["GOOGLE_API_KEY"])
+    GEMINI_TIMEOUT = float(st.secrets["GEMINI_TIMEOUT"])
 
 except (FileNotFoundError, KeyError):
-    genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+    GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", 20))
 
-PROMPT_TEMPLATE = """
+PROMPT_TEMPLATE = Template("""
 You are a highly intelligent AI-powered Technical Recruiter. 
 Your primary goal is to dynamically adapt your expertise to match the specific role described in the provided Job Description. 
 You must act as a specialist for whatever role is presented to you.
 
 Instructions:
 1.  Determine Key Criteria: First, carefully analyze the provided 'Job Description' to identify the 5-7 most critical skills, technologies and qualifications required for the role. This set of criteria becomes your evaluation rubric. Do not use a generic software engineering rubric, it must be tailored to the specific job.
-2.  Analyze the Resume against Criteria: Next, thoroughly review the candidate's 'Resume Text'. Scrutinize their experience, projects and listed skills to find evidence of the key criteria you identified in step 1.
-3.  Score and Justify: Based on how well the resume aligns with the key criteria, provide a holistic fit score from 0 to 100. Your reasoning must clearly connect the resume's content (or lack thereof) to the job description's specific requirements.
+2.  Analyze each Resume against Criteria: Next, thoroughly review every candidate's resume inside the 'Resumes' section, each wrapped in a <resume id="..."> tag. Scrutinize their experience, projects and listed skills to find evidence of the key criteria you identified in step 1. Evaluate each resume independently, never compare candidates against each other.
+3.  Score and Justify: Based on how well each resume aligns with the key criteria, provide a holistic fit score from 0 to 100. Your reasoning must clearly connect the resume's content (or lack thereof) to the job description's specific requirements.
 4.  Maintain Objectivity: Base your entire analysis strictly on the information given in the resume and the job description. Do not invent or infer details.
-5.  JSON Output Only: Your entire response must be a single, valid JSON object. Do not include any text, explanations or markdown formatting before or after the JSON object.
+5.  JSON Output Only: Your entire response must be a single, valid JSON object with exactly one entry in "results" per resume, carrying that resume's id. Do not include any text, explanations or markdown formatting before or after the JSON object.
 
 Job Description:
 <job_description>
-{job_description}
+$job_description
 </job_description>
 
-Resume Text:
-<resume_text>
-{resume_text}
-</resume_text>
+Resumes:
+<resumes>
+$resumes
+</resumes>
 
 Required JSON Output Format:
-{{
-    "candidate_name": "Full Name",
-    "score": <integer from 0-100>,
-    "summary": "A 2-3 sentence summary of the candidate's overall fit for this specific role.",
-    "reasoning": "A single string containing a detailed analysis in markdown format. It must start with '**Strengths:**' followed by bullet points and then '**Gaps:**' followed by bullet points. For example: '**Strengths:**\\n- 5+ years of Java experience.\\n- Experience with REST APIs and SQL.\\n\\n**Gaps:**\\n- Lacks experience with cloud platforms (AWS/GCP) mentioned in the JD.'",
-    "is_recommended": <boolean, true if score >= 70, else false>
-}}
-"""
-
-def parse_resume(file_bytes, filename) -> str:
-    text = ""
-    try:
-        if filename.endswith(".pdf"):
-            with fitz.open(stream=file_bytes, filetype="pdf") as doc:
-                text = "".join(page.get_text() for page in doc)
-        elif filename.endswith(".docx"):
-            doc = docx.Document(io.BytesIO(file_bytes))
-            text = "\n".join(para.text for para in doc.paragraphs)
-    
-    except Exception as e:
-        st.error(f"Error parsing {filename} : {e}")
-    return text
+{
+    "results": [
+        {
+            "id": "The id attribute of the resume being scored",
+            "candidate_name": "Full Name",
+            "score": <integer from 0-100>,
+            "summary": "A 2-3 sentence summary of the candidate's overall fit for this specific role.",
+            "reasoning": "A single string containing a detailed analysis in markdown format. It must start with '**Strengths:**' followed by bullet points and then '**Gaps:**' followed by bullet points. For example: '**Strengths:**\\n- 5+ years of Java experience.\\n- Experience with REST APIs and SQL.\\n\\n**Gaps:**\\n- Lacks experience with cloud platforms (AWS/GCP) mentioned in the JD.'",
+            "is_recommended": <boolean, true if score >= 70, else false>
+        }
+    ]
+}
+""")
+
+GEMINI_CONCURRENCY = 20
+GEMINI_BATCH_SIZE = 5
+PARSE_WORKERS = min(os.cpu_count() or 1, 4)
+PDF_PAGES_PER_TASK = 8
+MAX_RESUME_CHARS = 12_000
+ANALYSIS_CACHE_TTL = 3600
+ANALYSIS_CACHE_MAX_ENTRIES = 1024
+STREAM_PREVIEW_CHARS = 500
+GEMINI_MAX_RETRIES = 2
+RETRYABLE_ERRORS = (asyncio.TimeoutError, google_exceptions.DeadlineExceeded, google_exceptions.ServiceUnavailable)
+
+@st.cache_resource
+def _parse_pool() -> ProcessPoolExecutor:
+    start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=multiprocessing.get_context(start_method))
+
+@st.cache_resource(ttl=ANALYSIS_CACHE_TTL)
+def _analysis_cache() -> tuple:
+    return {}, threading.Lock()
+
+def _content_hash(text: str) -> str:
+    return hashlib.sha256(unicodedata.normalize("NFKC", text).strip().encode()).hexdigest()
+
+def _cache_get(key: tuple):
+    cache, _ = _analysis_cache()
+    cached = cache.get(key)
+    return CandidateAnalysis.model_validate_json(cached) if cached else None
+
+def _cache_put(key: tuple, analysis: CandidateAnalysis):
+    cache, lock = _analysis_cache()
+    with lock:
+        cache[key] = analysis.model_dump_json()
+        while len(cache) > ANALYSIS_CACHE_MAX_ENTRIES:
+            cache.pop(next(iter(cache)))
+
+def _build_model() -> genai.GenerativeModel:
+    model = genai.GenerativeModel(
+        'gemini-1.5-flash-latest',
+        generation_config={"response_mime_type": "application/json", "response_schema": gemini_batch_schema(), "temperature": 0}
+    )
+    # The SDK's default async client is process-wide and bound to the first event loop, each run needs its own
+    model._async_client = genai_client._client_manager.make_client("generative_async")
+    return model
+
+async def _stream_response(model, prompt: str, placeholder, batch_size: int) -> str:
+    response = await asyncio.wait_for(
+        model.generate_content_async(prompt, stream=True, request_options={"timeout": GEMINI_TIMEOUT * batch_size}),
+        timeout=GEMINI_TIMEOUT
+    )
+    chunks = aiter(response)
+    streamed_text = ""
+    while True:
+        try:
+            chunk = await asyncio.wait_for(anext(chunks), timeout=GEMINI_TIMEOUT)
+        except StopAsyncIteration:
+            break
+        streamed_text += chunk.text
+        placeholder.text(streamed_text[-STREAM_PREVIEW_CHARS:] + "…")
+    await response.resolve()
+    return response.text
+
+async def _generate_with_retry(model, prompt: str, semaphore: asyncio.Semaphore, placeholder, batch_size: int) -> str:
+    for attempt in range(GEMINI_MAX_RETRIES + 1):
+        try:
+            async with semaphore:
+                return await _stream_response(model, prompt, placeholder, batch_size)
+
+        except RETRYABLE_ERRORS:
+            if attempt == GEMINI_MAX_RETRIES:
+                raise
+            placeholder.text(f"Gemini timed out, retrying ({attempt + 1}/{GEMINI_MAX_RETRIES}) …")
+            await asyncio.sleep(random.uniform(0.5, 1.5) * 2 ** attempt)
+
+def _failed_analysis(summary: str, reasoning: str) -> CandidateAnalysis:
+    return CandidateAnalysis(
+        candidate_name="Unknown/Error", score=0, summary=summary,
+        reasoning=reasoning, is_recommended=False
+    )
+
+def _fill_failures(analyses: list, summary: str, reasoning: str) -> list:
+    return [analysis or _failed_analysis(summary, reasoning) for analysis in analyses]
+
+def _response_results(response_text: str) -> dict:
+    results = json.loads(response_text)['results']
+    return {str(result.get('id')): result for result in results if isinstance(result, dict)}
+
+def _format_resumes(resume_texts: list) -> str:
+    return "\n".join(f'<resume id="{i}">\n{text}\n</resume>' for i, text in enumerate(resume_texts, start=1))
 
-def analyze_with_gemini(job_description: str, resume_text: str) -> CandidateAnalysis:
-    model = genai.GenerativeModel('gemini-1.5-flash-latest')
-    prompt = PROMPT_TEMPLATE.format(job_description=job_description, resume_text=resume_text)
+async def analyze_batch(model: genai.GenerativeModel, job_description: str, resume_texts: list, semaphore: asyncio.Semaphore, placeholder) -> list:
+    jd_hash = _content_hash(job_description)
+    cache_keys = [(jd_hash, _content_hash(text)) for text in resume_texts]
+    analyses = [_cache_get(key) for key in cache_keys]
+    missing = [i for i, analysis in enumerate(analyses) if analysis is None]
+    if not missing:
+        placeholder.empty()
+        return analyses
+
+    prompt = PROMPT_TEMPLATE.substitute(
+        job_description=job_description,
+        resumes=_format_resumes([resume_texts[i] for i in missing])
+    )
+    response_text = ""
 
     try:
-        response = model.generate_content(prompt)
-        response_text = response.text.strip().replace("```json", "").replace("```", "")
-        response_json = json.loads(response_text)
+        response_text = await _generate_with_retry(model, prompt, semaphore, placeholder, len(missing))
+        results = _response_results(response_text)
+
+        for resume_id, index in enumerate(missing, start=1):
+            result = results.get(str(resume_id))
+            if result is None:
+                analyses[index] = _failed_analysis(
+                    "Analysis failed, the resume was missing from the response !",
+                    f"Gemini returned no result for this resume, raw response : {response_text}"
+                )
+                continue
 
-        if isinstance(response_json.get('reasoning'), dict):
-            reasoning_dict = response_json['reasoning']
-            strengths = reasoning_dict.get('Strengths', 'N/A')
-            gaps = reasoning_dict.get('Gaps', 'N/A')
-            response_json['reasoning'] = f"\n**Strengths:**\n{strengths}\n\n**Gaps:**\n{gaps}"
+            try:
+                analyses[index] = CandidateAnalysis.model_validate(result)
+            except ValidationError as e:
+                analyses[index] = _failed_analysis(
+                    "Analysis failed due to response format error !",
+                    f"Gemini returned an invalid result for this resume : {e}"
+                )
+                continue
 
-        return CandidateAnalysis(**response_json)
+            _cache_put(cache_keys[index], analyses[index])
 
-    except (json.JSONDecodeError, TypeError, KeyError) as e:
+    except (json.JSONDecodeError, KeyError, TypeError) as e:
         st.error(f"Error parsing Gemini's JSON response : {e}, the model might have returned an invalid format !")
-        return CandidateAnalysis(
-            candidate_name="Unknown/Error", score=0, summary="Analysis failed due to response format error !",
-            reasoning=f"Failed to parse model output, raw response : {response.text}", is_recommended=False
+        analyses = _fill_failures(
+            analyses, "Analysis failed due to response format error !",
+            f"Failed to parse model output, raw response : {response_text}"
+        )
+    except RETRYABLE_ERRORS as e:
+        st.error(f"Gemini did not respond after {GEMINI_MAX_RETRIES + 1} attempts : {e!r}")
+        analyses = _fill_failures(
+            analyses, "Analysis timed out !",
+            f"Gemini stalled for more than {GEMINI_TIMEOUT:g}s on each of {GEMINI_MAX_RETRIES + 1} attempts."
         )
     except Exception as e:
         st.error(f"An unexpected error occurred during analysis : {e}")
-        return CandidateAnalysis(
-            candidate_name="Unknown/Error", score=0, summary="Analysis failed !",
-            reasoning=f"An unexpected error occurred : {str(e)}", is_recommended=False
-        )
+        analyses = _fill_failures(analyses, "Analysis failed !", f"An unexpected error occurred : {str(e)}")
+    finally:
+        placeholder.empty()
 
-st.set_page_config(page_title="Resume Shortlister", page_icon="🤖", layout="wide")
-
-st.title("Resume Shortlister")
-st.markdown("I’m Max and I instantly rank candidates to accelerate your hiring process.")
-
-st.sidebar.header("How to Use")
-st.sidebar.info(
-    "1. Paste the Job Description into the text area.\n"
-    "2. Upload Resumes (PDF or DOCX).\n"
-    "3. Click 'Analyze' to start the process.\n"
-    "4. Review the ranked results."
-)
-st.sidebar.warning("Note: Your data is not stored and the analysis is performed in real-time.")
-
-jd_input = st.text_area("Paste the Job Description here", height=200)
-resume_files = st.file_uploader(
-    "Upload Candidate Resumes",
-    type=["pdf", "docx"],
-    accept_multiple_files=True
-)
-
-if st.button("Analyze", type="primary"):
-    if not jd_input.strip():
-        st.error("Please paste a job description.")
-    elif not resume_files:
-        st.error("Please upload at least one resume.")
-    else:
-        with st.spinner("Analyzing ... this may take a few moments ..."):
-            all_analyses = []
-            progress_bar = st.progress(0)
-            
-            for i, file in enumerate(resume_files):
-                st.write(f"Processing {file.name} ...")
-                file_bytes = file.read()
-                resume_text = parse_resume(file_bytes, file.name)
-                
-                if resume_text:
-                    analysis = analyze_with_gemini(jd_input, resume_text)
-                    all_analyses.append(analysis)
-                
-                progress_bar.progress((i + 1) / len(resume_files))
+    return analyses
+
+async def _parse_in_pool(executor: ProcessPoolExecutor, file_bytes: bytes, filename: str) -> str:
+    loop = asyncio.get_running_loop()
+    if filename.endswith(".docx"):
+        return await loop.run_in_executor(executor, parse_docx, file_bytes)
+    if not filename.endswith(".pdf"):
+        return ""
 
-            progress_bar.empty()
+    page_count, first_text = await loop.run_in_executor(executor, parse_pdf_pages, file_bytes, 0, PDF_PAGES_PER_TASK)
+    if page_count <= PDF_PAGES_PER_TASK:
+        return first_text
+
+    remaining = page_count - PDF_PAGES_PER_TASK
+    pages_per_worker = max(PDF_PAGES_PER_TASK, -(-remaining // PARSE_WORKERS))
+    results = await asyncio.gather(*(
+        loop.run_in_executor(executor, parse_pdf_pages, file_bytes, start, start + pages_per_worker)
+        for start in range(PDF_PAGES_PER_TASK, page_count, pages_per_worker)
+    ))
+    return " ".join(text for text in [first_text, *(text for _, text in results)] if text)
+
+async def _parse_with_pool(file_bytes: bytes, filename: str) -> str:
+    executor = _parse_pool()
+    try:
+        return await _parse_in_pool(executor, file_bytes, filename)
+
+    except BrokenProcessPool:
+        if _parse_pool() is executor:
+            _parse_pool.clear()
+        executor.shutdown(wait=False, cancel_futures=True)
+        return await _parse_in_pool(_parse_pool(), file_bytes, filename)
+
+async def parse_resume_async(file_bytes: bytes, filename: str) -> tuple:
+    try:
+        resume_text = await _parse_with_pool(file_bytes, filename)
+
+    except Exception as e:
+        st.error(f"Error parsing {filename} : {e}")
+        return filename, ""
+
+    if len(resume_text) > MAX_RESUME_CHARS:
+        st.caption(f"{filename} was trimmed from {len(resume_text):,} to {MAX_RESUME_CHARS:,} characters before analysis.")
+        resume_text = resume_text[:MAX_RESUME_CHARS]
+    return filename, resume_text
+
+async def analyze_all(job_description: str, files: list, on_progress) -> list:
+    model = _build_model()
+    try:
+        return await _analyze_resumes(model, job_description, files, on_progress)
+    finally:
+        await model._async_client.transport.close()
+
+async def _analyze_resumes(model: genai.GenerativeModel, job_description: str, files: list, on_progress) -> list:
+    semaphore = asyncio.Semaphore(GEMINI_CONCURRENCY)
+    batch_tasks = []
+    pending_hashes, pending_texts = [], []
+    first_seen, duplicates = {}, []
+    analyses_by_hash = {}
+    analyses = []
+    done = 0
+
+    async def run_batch(resume_hashes: list, resume_texts: list) -> tuple:
+        placeholder = st.empty()
+        placeholder.caption(f"Scoring {', '.join(first_seen[resume_hash] for resume_hash in resume_hashes)} ...")
+        return resume_hashes, await analyze_batch(model, job_description, resume_texts, semaphore, placeholder)
+
+    def dispatch_batch():
+        batch_tasks.append(asyncio.create_task(run_batch(pending_hashes.copy(), pending_texts.copy())))
+        pending_hashes.clear()
+        pending_texts.clear()
+
+    parse_tasks = [parse_resume_async(file_bytes, filename) for file_bytes, filename in files]
+
+    for task in asyncio.as_completed(parse_tasks):
+        filename, resume_text = await task
+        if not resume_text:
+            done += 1
+            on_progress(done, len(files), filename)
+            continue
+
+        resume_hash = _content_hash(resume_text)
+        if resume_hash in first_seen:
+            st.info(f"{filename} is identical to {first_seen[resume_hash]}, reusing its analysis.")
+            duplicates.append((resume_hash, filename))
+            continue
+
+        first_seen[resume_hash] = filename
+        pending_hashes.append(resume_hash)
+        pending_texts.append(resume_text)
+        if len(pending_texts) == GEMINI_BATCH_SIZE:
+            dispatch_batch()
+
+    if pending_texts:
+        dispatch_batch()
+
+    for task in asyncio.as_completed(batch_tasks):
+        resume_hashes, batch_analyses = await task
+        for resume_hash, analysis in zip(resume_hashes, batch_analyses):
+            analyses_by_hash[resume_hash] = analysis
+            analyses.append(analysis.model_copy(update={"source_file": first_seen[resume_hash]}))
+        done += len(batch_analyses)
+        on_progress(done, len(files), ", ".join(first_seen[resume_hash] for resume_hash in resume_hashes))
+
+    for resume_hash, filename in duplicates:
+        analyses.append(analyses_by_hash[resume_hash].model_copy(update={"source_file": filename}))
+        done += 1
+        on_progress(done, len(files), filename)
+
+    return analyses
+
+def main():
+    try:
+        genai.configure(api_key=st.secrets["GOOGLE_API_KEY"])
+
+    except (FileNotFoundError, KeyError):
+        genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+
+    st.set_page_config(page_title="Resume Shortlister", page_icon="🤖", layout="wide")
+
+    st.title("Resume Shortlister")
+    st.markdown("I’m Max and I instantly rank candidates to accelerate your hiring process.")
+
+    st.sidebar.header("How to Use")
+    st.sidebar.info(
+        "1. Paste the Job Description into the text area.\n"
+        "2. Upload Resumes (PDF or DOCX).\n"
+        "3. Click 'Analyze' to start the process.\n"
+        "4. Review the ranked results."
+    )
+    st.sidebar.warning("Note: Uploaded files are not stored. Analyses are kept in server memory for up to an hour so repeat runs are instant.")
+
+    jd_input = st.text_area("Paste the Job Description here", height=200)
+    resume_files = st.file_uploader(
+        "Upload Candidate Resumes",
+        type=["pdf", "docx"],
+        accept_multiple_files=True
+    )
+
+    if st.button("Analyze", type="primary"):
+        if not jd_input.strip():
+            st.error("Please paste a job description.")
+        elif not resume_files:
+            st.error("Please upload at least one resume.")
+        else:
+            with st.status("Analyzing resumes ...", expanded=True) as status:
+                files = [(file.getvalue(), file.name) for file in resume_files]
+
+                all_analyses = asyncio.run(analyze_all(
+                    jd_input, files,
+                    lambda done, total, current: status.update(label=f"Analyzed {done} of {total} resumes, finished {current} ...")
+                ))
+
+                status.update(label="Analysis complete", state="complete", expanded=False)
 
             if all_analyses:
-                ranked_candidates = sorted(all_analyses, key=lambda x: x.score, reverse=True)
-                
-                st.subheader("Analysis Results")
+                ranked_candidates = sorted(all_analyses, key=operator.attrgetter('score'), reverse=True)
             
+                st.subheader("Analysis Results")
+        
                 for candidate in ranked_candidates:
-                    expander_title = f"**{candidate.candidate_name}**"
-                    
+                    expander_title = f"**{candidate.candidate_name}** · {candidate.source_file}"
+                
                     with st.expander(expander_title, expanded=False):
                         score_color = "green" if candidate.is_recommended else "orange"
                         score_html = f"**Score:** <span style='color:{score_color}; font-size: 1.1em;'>{candidate.score}/100</span>"
@@ -153,6 +381,9 @@ if st.button("Analyze", type="primary"):
                             st.success("Recommended for Interview")
                         else:
                             st.warning("Review with Caution")
-                        
+                    
                         st.markdown("**Summary:**")
-                        st.markdown(candidate.summary)
\ No newline at end of file
+                        st.markdown(candidate.summary)
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,32 @@
-from pydantic import BaseModel, Field
-from typing import List
+from pydantic import BaseModel, ConfigDict, Field
 
 class CandidateAnalysis(BaseModel):
+    model_config = ConfigDict(frozen=True, extra='ignore', validate_assignment=False)
+
     candidate_name: str = Field(description="The candidate's name, extracted from the resume.")
     score: int = Field(description="A score from 0 to 100 representing the fit for the job.", ge=0, le=100)
     summary: str = Field(description="A 2-3 sentence summary of the candidate's fit.")
     reasoning: str = Field(description="Detailed bullet-point reasoning for the score, highlighting strengths and weaknesses.")
-    is_recommended: bool = Field(description="A simple boolean indicating if the candidate is recommended for an interview.")
\ No newline at end of file
+    is_recommended: bool = Field(description="A simple boolean indicating if the candidate is recommended for an interview.")
+    source_file: str = Field(default="", description="The uploaded file this analysis was produced from, filled in by the app.")
+
+def gemini_batch_schema() -> dict:
+    # Gemini's Schema only understands type/description, so bounds like ge/le stay on the pydantic side
+    json_schema = CandidateAnalysis.model_json_schema()
+    required = ["id", *json_schema["required"]]
+    properties = {"id": {"type": "string", "description": "The id attribute of the <resume> tag this analysis belongs to."}}
+    for name in json_schema["required"]:
+        field = json_schema["properties"][name]
+        properties[name] = {"type": field["type"], "description": field["description"]}
+
+    return {
+        "type": "object",
+        "properties": {
+            "results": {
+                "type": "array",
+                "description": "One analysis per resume in the prompt.",
+                "items": {"type": "object", "properties": properties, "required": required},
+            }
+        },
+        "required": ["results"],
+    }
@@ -0,0 +1,62 @@
+import io
+import re
+import zipfile
+import fitz
+import docx
+from lxml import etree
+
+PDF_TEXT_FLAGS = fitz.TEXTFLAGS_TEXT & ~fitz.TEXT_PRESERVE_LIGATURES
+WORD_NAMESPACE = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+WORD_PARAGRAPH = WORD_NAMESPACE + "p"
+WORD_RUN = WORD_NAMESPACE + "r"
+WORD_TEXT = WORD_NAMESPACE + "t"
+MC_FALLBACK = "{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback"
+WORD_RUN_WHITESPACE = {
+    WORD_NAMESPACE + "tab": "\t",
+    WORD_NAMESPACE + "br": "\n",
+    WORD_NAMESPACE + "cr": "\n",
+}
+
+def _pdf_page_texts(doc: fitz.Document, start: int, stop: int) -> list:
+    page_texts = (page.get_text("text", flags=PDF_TEXT_FLAGS, sort=False) for page in doc.pages(start, stop))
+    return [text for text in page_texts if text.strip()]
+
+def _clean_text(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip()
+
+def parse_pdf_pages(file_bytes: bytes, start: int, stop: int) -> tuple:
+    with fitz.open(stream=file_bytes, filetype="pdf") as doc:
+        page_count = doc.page_count
+        text = "\n".join(_pdf_page_texts(doc, start, min(stop, page_count)))
+    return page_count, _clean_text(text)
+
+def _parse_docx_xml(file_bytes: bytes) -> str:
+    paragraphs, open_paragraphs = [], []
+    fallback_depth = 0
+    tags = (WORD_PARAGRAPH, WORD_TEXT, MC_FALLBACK, *WORD_RUN_WHITESPACE)
+    with zipfile.ZipFile(io.BytesIO(file_bytes)) as archive, archive.open("word/document.xml") as document:
+        for event, element in etree.iterparse(document, events=("start", "end"), tag=tags):
+            if element.tag == MC_FALLBACK:
+                fallback_depth += 1 if event == "start" else -1
+            elif fallback_depth:
+                continue
+            elif element.tag == WORD_PARAGRAPH:
+                if event == "start":
+                    open_paragraphs.append([])
+                else:
+                    paragraphs.append("".join(open_paragraphs.pop()))
+                    element.clear()
+            elif event == "end" and open_paragraphs:
+                if element.tag == WORD_TEXT:
+                    open_paragraphs[-1].append(element.text or "")
+                elif element.getparent().tag == WORD_RUN:
+                    open_paragraphs[-1].append(WORD_RUN_WHITESPACE[element.tag])
+    return "\n".join(paragraphs)
+
+def parse_docx(file_bytes: bytes) -> str:
+    try:
+        text = _parse_docx_xml(file_bytes)
+    except (zipfile.BadZipFile, KeyError, etree.XMLSyntaxError):
+        doc = docx.Document(io.BytesIO(file_bytes))
+        text = "\n".join(para.text for para in doc.paragraphs)
+    return _clean_text(text)